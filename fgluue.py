@@ -3,113 +3,516 @@ FGlue v2.1: простое GUI-приложение для объединени
 by @iskairov
 """
 
+import codecs
+import contextlib
+import functools
 import hashlib
+import io
 import os
 import sys
 import re
+import zlib
 import tkinter as tk
 from datetime import datetime
 from tkinter import ttk, filedialog, messagebox
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 
-class FileContext:
-    """ Класс для работы с файлами: собирает метаданные файла, ведет счетчики и позволяет подставлять их в шаблоны. """
+# Плейсхолдер вида {pattern} или {pattern:arg1;arg2}
+_PLACEHOLDER_RE = re.compile(r"{([a-zA-Z0-9_]+)(?:\:([^}]+))?}")
+
+# Маркеры {show_before}/{show_after} (без учёта регистра)
+_SHOW_BEFORE_RE = re.compile(r"\{show_before\}", re.IGNORECASE)
+_SHOW_AFTER_RE = re.compile(r"\{show_after\}", re.IGNORECASE)
+
+# Размер блока при потоковом чтении файла для хэширования
+_HASH_CHUNK_SIZE = 1 << 16
+
+# Алгоритмы, доступные в плейсхолдере {hash:algo}; crc32 — быстрая контрольная сумма (не криптографическая)
+_HASH_ALGORITHMS = ("md5", "sha1", "crc32")
+
+# Размер куска, которыми большой результат вставляется в окно предпросмотра
+_PREVIEW_CHUNK_SIZE = 1 << 16
+# Доля прокрутки загруженного текста, после которой в предпросмотр дописывается следующий кусок
+_PREVIEW_LOAD_THRESHOLD = 0.9
+
+# Единицы размера файла для {size}: каждая следующая в 1024 раза больше
+_SIZE_UNITS = ("Б", "КБ", "МБ", "ГБ", "ТБ")
+
+# Ограничения кэша прочитанных файлов между объединениями: число файлов и суммарный размер
+_FILE_CACHE_MAX_FILES = 256
+_FILE_CACHE_MAX_BYTES = 64 << 20
+
+# Расширения заведомо двоичных файлов: их содержимое не читается и не декодируется как текст.
+# Только форматы, которые не бывают корректным UTF-8; неоднозначные (.obj, .bin, .db, .tar, .pdf)
+# декодируются как обычно и пропускаются, только если не читаются как UTF-8
+_BINARY_EXTS = frozenset({
+    ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".ico", ".webp", ".tif", ".tiff",
+    ".zip", ".gz", ".bz2", ".xz", ".7z", ".rar",
+    ".exe", ".dll", ".so", ".dylib", ".o", ".class", ".pyc",
+    ".doc", ".xls", ".ppt", ".docx", ".xlsx", ".pptx",
+    ".mp3", ".wav", ".flac", ".ogg", ".mp4", ".avi", ".mkv", ".mov", ".webm",
+    ".ttf", ".otf", ".woff", ".woff2", ".sqlite",
+})
+
+
+def _is_binary_path(path: str) -> bool:
+    """ Проверяет по расширению, что файл заведомо двоичный. """
+
+    return os.path.splitext(path)[1].lower() in _BINARY_EXTS
+
+
+class _Crc32:
+    """ Контрольная сумма CRC32 (zlib) с интерфейсом объекта hashlib: update() и hexdigest(). """
+
+    def __init__(self, data: bytes = b"") -> None:
+        self.value = zlib.crc32(data)
+
+    def update(self, data: bytes) -> None:
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        return f"{self.value:08x}"
+
+
+def _new_hasher(algo: str, data: bytes = b"") -> Any:
+    """ Создаёт объект хэша для алгоритма из _HASH_ALGORITHMS: crc32 — из zlib, остальные — из hashlib. """
+
+    return _Crc32(data) if algo == "crc32" else hashlib.new(algo, data)
+
+
+def _file_digest(path: str, algo: str) -> str:
+    """
+    Возвращает хэш файла, читая его потоково блоками, а не целиком в память.
+    hashlib и zlib отпускают GIL на время обновления, поэтому функцию можно вызывать из нескольких потоков.
+
+    :param path: Путь к файлу.
+    :param algo: Имя алгоритма из _HASH_ALGORITHMS, например "md5" или "crc32".
+    """
+
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+: цикл чтения и обновления выполняется внутри hashlib
+            return hashlib.file_digest(f, lambda: _new_hasher(algo)).hexdigest()
+        h = _new_hasher(algo)
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+# Плейсхолдеры, для которых счетчики current_* должны учитывать содержимое файлов
+_CURRENT_STATS_PLACEHOLDERS = frozenset({"current_lines_count", "current_words_count", "current_chars_count"})
+
+# Плейсхолдеры, которым нужно содержимое файла
+_CONTENT_PLACEHOLDERS = frozenset({
+    "content", "line", "lines", "head", "tail", "char", "chars", "headchars", "tailchars",
+    "lines_count", "words_count", "chars_count",
+}) | _CURRENT_STATS_PLACEHOLDERS
+
+# Итоговые значения по всем файлам, для которых нужен отдельный проход по файлам
+_TOTAL_STATS_PLACEHOLDERS = frozenset({"total_lines_count", "total_words_count", "total_chars_count"})
+
+# Плейсхолдеры, которым хватает первых строк файла
+_HEAD_LINE_PLACEHOLDERS = frozenset({"head", "line", "lines"})
+
+# Разделители строк, которые str.splitlines() учитывает помимо "\n"
+_RARE_LINEBREAK_RE = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+# Размер куска текста при подсчёте слов
+_WORD_COUNT_CHUNK = 1 << 20
+
+# Размер куска при потоковом подсчёте статистики файла
+_STATS_CHUNK_SIZE = 1 << 16
+
+# Пробельный символ — те же символы, по которым делит str.split()
+_SPACE_RE = re.compile(r"\s")
+
+
+def _remove_marker_lines(template: str, *markers: str) -> str:
+    """
+    Удаляет из шаблона строки (вместе с их переводом строки), содержащие любой из маркеров без учёта регистра.
+    Несколько маркеров убираются за один проход по шаблону.
+
+    :param template: Текст шаблона.
+    :param markers: Маркеры в нижнем регистре, например "{show_after}".
+    """
+
+    lowered = template.lower()
+    markers = tuple(marker for marker in markers if marker in lowered)
+    if not markers:
+        return template
+    pieces = template.split("\n")
+    lines = [piece + "\n" for piece in pieces[:-1]] + [pieces[-1]]
+    return "".join(line for line in lines if not any(marker in line.lower() for marker in markers))
+
+
+def _count_stats(text: str) -> Tuple[int, int, int]:
+    """
+    Считает строки, слова и символы текста.
+    Результат совпадает с len(text.splitlines()), len(text.split()) и len(text),
+    но строки считаются без построения списка строк.
+    """
+
+    if _RARE_LINEBREAK_RE.search(text):
+        lines_count = len(text.splitlines())
+    else:
+        lines_count = text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+    return lines_count, _count_words(text), len(text)
+
+
+def _scan_file(path: str, algos: Iterable[str] = (), count_stats: bool = False
+               ) -> Tuple[Dict[str, str], Optional[Tuple[int, int, int]]]:
+    """
+    Читает файл потоково один раз и по тем же кускам считает хэши и статистику.
+    Статистика совпадает с _count_stats по содержимому файла, но файл не держится в памяти целиком.
+    Двоичные файлы и файлы, которые не декодируются как UTF-8, дают нулевую статистику;
+    хэши при этом всё равно считаются по всему файлу.
+
+    :param path: Путь к файлу.
+    :param algos: Имена алгоритмов из _HASH_ALGORITHMS.
+    :param count_stats: Считать строки, слова и символы.
+    :return: Словарь алгоритм → hexdigest и статистика (None, если она не запрошена).
+    :raises OSError: Файл не удалось прочитать, а хэши запрошены (без хэшей статистика нулевая).
+    """
+
+    algos = list(algos)
+    if len(algos) == 1 and not count_stats:
+        return {algos[0]: _file_digest(path, algos[0])}, None
+
+    hashers = {algo: _new_hasher(algo) for algo in algos}
+    # Декодер как у текстового режима open(): UTF-8, переводы строк "\r\n" и "\r" → "\n"
+    decoder = None
+    if count_stats and not _is_binary_path(path):
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+
+    lines_count = words_count = chars_count = 0
+    last_char = ""
+
+    def count(chunk: str) -> None:
+        nonlocal lines_count, words_count, chars_count, last_char
+        if not chunk:
+            return
+        lines_count += chunk.count("\n")
+        if _RARE_LINEBREAK_RE.search(chunk):
+            lines_count += len(_RARE_LINEBREAK_RE.findall(chunk))
+        words_count += len(chunk.split())
+        # Слово, разрезанное границей кусков, посчитано дважды
+        if last_char and not last_char.isspace() and not chunk[0].isspace():
+            words_count -= 1
+        chars_count += len(chunk)
+        last_char = chunk[-1]
+
+    try:
+        with open(path, "rb", buffering=0) as f:
+            for data in iter(lambda: f.read(_STATS_CHUNK_SIZE), b""):
+                for h in hashers.values():
+                    h.update(data)
+                if decoder is not None:
+                    try:
+                        count(decoder.decode(data))
+                    except UnicodeDecodeError:
+                        # Содержимое не текст — статистика нулевая, но хэши дочитываем
+                        decoder = None
+            if decoder is not None:
+                try:
+                    count(decoder.decode(b"", final=True))
+                except UnicodeDecodeError:
+                    decoder = None
+    except OSError:
+        if hashers:
+            raise
+        decoder = None
+
+    digests = {algo: h.hexdigest() for algo, h in hashers.items()}
+    if not count_stats:
+        return digests, None
+    if decoder is None:
+        return digests, (0, 0, 0)
+    # Последняя строка без завершающего перевода строки
+    if last_char and last_char != "\n" and not _RARE_LINEBREAK_RE.match(last_char):
+        lines_count += 1
+    return digests, (lines_count, words_count, chars_count)
+
+
+def _file_cache_key(ctx: "FileContext") -> Optional[Tuple[int, int]]:
+    """
+    Ключ актуальности байтов файла в кэше: (st_mtime_ns, st_size); None, если os.stat не удался.
+    os.stat берётся из контекста (FileContext.stat), поэтому ключ должен быть получен до чтения файла.
+    """
+
+    try:
+        st = ctx.stat
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_head_lines(path: str, limit: int) -> List[str]:
+    """
+    Возвращает первые limit строк файла так же, как FileContext.lines[:limit],
+    но читает файл лишь до тех пор, пока эти строки не прочитаны целиком.
+    Двоичные и нечитаемые файлы, как и файлы, чьё прочитанное начало не декодируется как UTF-8,
+    дают пустой список. Ошибки кодировки дальше по файлу не проверяются: для такого файла начало
+    всё же возвращается, хотя при полном чтении его содержимое было бы пустым (описано в README).
+
+    :param path: Путь к файлу.
+    :param limit: Сколько первых строк нужно.
+    """
+
+    if limit <= 0 or _is_binary_path(path):
+        return []
+
+    data = b""
+    size = _STATS_CHUNK_SIZE
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(size)
+                at_eof = not chunk
+                data += chunk
+                try:
+                    text = data.decode("utf-8")
+                except UnicodeDecodeError as exc:
+                    # Обрезанный на границе куска символ — не ошибка, пока файл не кончился
+                    if at_eof or exc.start < len(data) - 3 or exc.reason != "unexpected end of data":
+                        return []
+                    text = data[:exc.start].decode("utf-8")
+                if "\r" in text:
+                    text = text.replace("\r\n", "\n").replace("\r", "\n")
+                lines = text.splitlines()
+                # Строка limit прочитана целиком, если после неё уже началась следующая
+                if at_eof or len(lines) > limit:
+                    return lines[:limit]
+                # Каждый следующий кусок вдвое больше: повторный разбор в сумме линеен
+                size *= 2
+    except OSError:
+        return []
+
+
+def _count_words(text: str) -> int:
+    """
+    Считает слова так же, как len(text.split()), но по кускам: список слов строится
+    не для всего текста сразу, а для фрагмента не больше _WORD_COUNT_CHUNK символов.
+    """
+
+    if len(text) <= _WORD_COUNT_CHUNK:
+        return len(text.split())
+
+    count = 0
+    start = 0
+    while start < len(text):
+        end = start + _WORD_COUNT_CHUNK
+        if end < len(text):
+            # Режем по пробельному символу, чтобы не разделить слово между кусками
+            match = _SPACE_RE.search(text, end)
+            end = match.start() if match else len(text)
+        count += len(text[start:end].split())
+        start = end
+    return count
+
+
+@dataclass
+class MergeSession:
+    """ Счетчики одного объединения файлов; передаётся в каждый FileContext явно. """
+
+    # Нарастающие счетчики по уже обработанным файлам (плейсхолдеры {counter} и {current_*})
+    files_count: int = 0
+    lines_count: int = 0
+    words_count: int = 0
+    chars_count: int = 0
+
+    # Суммарные значения по всем выбранным файлам (плейсхолдеры {total_*})
+    total_files: int = 0
+    total_lines: int = 0
+    total_words: int = 0
+    total_chars: int = 0
+
+    def add_file(self, ctx: "FileContext", count_stats: bool = True) -> None:
+        """
+        Учитывает файл в нарастающих счетчиках; вызывается перед подстановкой его шаблона.
+
+        :param ctx: Контекст файла.
+        :param count_stats: Учитывать строки, слова и символы файла (требует его содержимого).
+        """
 
-    files_counter = 0
+        self.files_count += 1
+        if count_stats:
+            self.lines_count += ctx.lines_count
+            self.words_count += ctx.words_count
+            self.chars_count += ctx.chars_count
 
-    # Счетчики для текущей сессии
-    current_files_count = 0
-    current_lines_count = 0
-    current_words_count = 0
-    current_chars_count = 0
 
-    # Суммарные счетчики по всем файлам
-    total_files = 0
-    total_lines = 0
-    total_words = 0
-    total_chars = 0
+class FileContext:
+    """ Класс для работы с файлами: собирает метаданные файла, ведет счетчики и позволяет подставлять их в шаблоны. """
 
-    def __init__(self, path: str) -> None:
+    def __init__(self, path: str, session: MergeSession, line_limit: Optional[int] = None) -> None:
         """
         Инициализация объекта FileContext.
-        Считывает содержимое файла, подсчитывает строки, слова и символы, обновляет счетчики.
+        Содержимое файла читается лениво, при первом обращении, и дальше переиспользуется.
 
         :param path: Путь к файлу.
+        :param session: Счетчики текущего объединения файлов (учёт файла — MergeSession.add_file).
+        :param line_limit: Шаблону нужны только первые line_limit строк (см. required_lines):
+                           тогда lines читает лишь начало файла.
         """
 
         self.path = path
+        self.line_limit = line_limit
+        # Один os.stat на все плейсхолдеры размера и дат; запрашивается при первом обращении
+        self._stat: Optional[os.stat_result] = None
+        # Посчитанные хэши файла: алгоритм → hexdigest
+        self._hashes: Dict[str, str] = {}
+
+        self.session = session
+
+    @property
+    def raw_bytes(self) -> Optional[bytes]:
+        """ Байты файла (None, если файл не прочитать); читаются один раз — и для текста, и для хэшей. """
+
+        # Не functools.cached_property: до Python 3.12 он держит одну блокировку на все экземпляры,
+        # и файлы, читаемые из пула потоков, читались бы строго по очереди.
+        # В пуле (prefetch) используются только raw_bytes и _stats; остальные свойства — при подстановке
+        if "raw_bytes" not in self.__dict__:
+            try:
+                with open(self.path, "rb") as f:
+                    self.__dict__["raw_bytes"] = f.read()
+            except OSError:
+                self.__dict__["raw_bytes"] = None
+        return self.__dict__["raw_bytes"]
 
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                self.content = f.read()
-        except Exception:
-            self.content = ""
+    @raw_bytes.setter
+    def raw_bytes(self, data: Optional[bytes]) -> None:
+        self.__dict__["raw_bytes"] = data
 
-        self.lines = self.content.splitlines()
+    @property
+    def loaded_bytes(self) -> Optional[bytes]:
+        """ Байты файла, если они уже прочитаны (или переданы из кэша); сам файл не читается. """
 
-        self.lines_count = len(self.lines)
-        self.words_count = len(self.content.split())
-        self.chars_count = len(self.content)
+        return self.__dict__.get("raw_bytes")
 
-        FileContext.files_counter += 1
+    @functools.cached_property
+    def raw_content(self) -> str:
+        """ Исходное содержимое файла; читается при первом обращении. Для двоичных файлов — пустое. """
 
-        FileContext.current_files_count += 1
-        FileContext.current_lines_count += self.lines_count
-        FileContext.current_words_count += self.words_count
-        FileContext.current_chars_count += self.chars_count
+        return self._decode_raw_bytes()
 
-    @staticmethod
-    def reset_counters():
+    def _decode_raw_bytes(self) -> str:
+        """ Декодирует байты файла в текст (без кэширования); нечитаемые и двоичные файлы дают пустую строку. """
+
+        if _is_binary_path(self.path) or self.raw_bytes is None:
+            return ""
+        try:
+            text = self.raw_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            return ""
+        # Как при чтении в текстовом режиме: переводы строк "\r\n" и "\r" приводятся к "\n"
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    @functools.cached_property
+    def content(self) -> str:
+        """ Содержимое для подстановки; модификаторы содержимого заменяют его. """
+
+        return self.raw_content
+
+    @functools.cached_property
+    def lines(self) -> List[str]:
+        """ Строки исходного содержимого (модификаторы на них не влияют). """
+
+        # Если нужно только начало файла и целиком он ещё не прочитан, читаем лишь начало
+        if self.line_limit is not None and "raw_content" not in self.__dict__:
+            return _read_head_lines(self.path, self.line_limit)
+        return self.raw_content.splitlines()
+
+    @property
+    def _stats(self) -> Tuple[int, int, int]:
+        # Как и raw_bytes, не functools.cached_property: статистика считается в пуле потоков (prefetch).
+        # Ради одной статистики декодированный текст не кэшируется: для итоговых счетчиков
+        # иначе в памяти оказалось бы содержимое всех файлов сразу
+        if "_stats" not in self.__dict__:
+            text = self.__dict__.get("raw_content")
+            self.__dict__["_stats"] = _count_stats(self._decode_raw_bytes() if text is None else text)
+        return self.__dict__["_stats"]
+
+    @property
+    def lines_count(self) -> int:
+        return self._stats[0]
+
+    @property
+    def words_count(self) -> int:
+        return self._stats[1]
+
+    @property
+    def chars_count(self) -> int:
+        return self._stats[2]
+
+    @property
+    def stat(self) -> os.stat_result:
+        """ Метаданные файла (os.stat), считываются один раз и кэшируются. """
+
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def release_content(self) -> None:
         """
-        Сбрасывает все счетчики файлов, строк, слов и символов как для текущей сессии, так и суммарные.
-        Используется для начала новой серии операций с файлами.
+        Освобождает прочитанное содержимое файла после подстановки его шаблона,
+        чтобы при объединении не держать в памяти все файлы сразу.
+        Посчитанная статистика (_stats) и хэши сохраняются.
         """
 
-        FileContext.files_counter = 0
-
-        FileContext.current_files_count = 0
-        FileContext.current_lines_count = 0
-        FileContext.current_words_count = 0
-        FileContext.current_chars_count = 0
-
-        FileContext.total_files = 0
-        FileContext.total_lines = 0
-        FileContext.total_words = 0
-        FileContext.total_chars = 0
+        for name in ("raw_bytes", "raw_content", "content", "lines"):
+            self.__dict__.pop(name, None)
 
-    def _apply_content_modifier(self, template: str, pattern: str, func, delete_line: bool = False) -> str:
+    def _file_hash(self, algo: str) -> str:
         """
-        Применяет модификатор содержимого к текущему файлу и удаляет плейсхолдер из шаблона.
+        Возвращает хэш файла. Если байты файла уже прочитаны ради содержимого, хэшируются они;
+        иначе файл читается потоково блоками, а не целиком в память.
+        Результат кэшируется, поэтому повторные плейсхолдеры с тем же алгоритмом бесплатны.
 
-        :param template: Шаблон текста, где ищем плейсхолдер.
-        :param pattern: Имя плейсхолдера, например "upper", "lower", "remove_whitespaces".
-        :param func: Функция, принимающая self (FileContext) и аргументы, возвращающая новое содержимое.
-                     Результат func автоматически присваивается self.content.
-        :param delete_line: Если True, удаляется вся строка с плейсхолдером, вместо простой замены.
-
-        :return: Новый шаблон с удалённым плейсхолдером.
+        :param algo: Имя алгоритма из _HASH_ALGORITHMS, например "md5" или "crc32".
         """
 
-        if delete_line:
-            # Удаляем всю строку с плейсхолдером
-            regex_line = r".*{" + pattern + r"(?:\:[^}]*)?}.*\n?"
-            return re.sub(regex_line, "", template)
-        else:
-            # Ищем плейсхолдеры вида {pattern} или {pattern:arg1;arg2}
-            regex = r"{(" + pattern + r")(?:\:([^}]+))?}"
+        digest = self._hashes.get(algo)
+        if digest is None:
+            data = self.loaded_bytes
+            if data is not None:
+                digest = _new_hasher(algo, data).hexdigest()
+            else:
+                digest = _file_digest(self.path, algo)
+            self._hashes[algo] = digest
+        return digest
 
-            def repl(match: re.Match) -> str:
-                # Разбираем аргументы плейсхолдера
-                args = match.group(2).split(";") if match.group(2) else []
-                # Применяем функцию к self и сохраняем результат в self.content
-                self.content = func(self, *args)
-                # Плейсхолдер удаляется из шаблона
-                return ""
+    def prefetch(self, algos: Iterable[str], load_content: bool = False,
+                 count_stats: bool = False) -> Optional[Tuple[int, int, int]]:
+        """
+        Заранее, за одно чтение файла, считает его хэши и статистику (строки, слова, символы);
+        рассчитан на вызов из пула потоков до подстановки шаблона.
+        Если содержимое (текстового) файла всё равно понадобится, файл читается целиком,
+        и всё считается по тем же байтам; иначе — за одно потоковое чтение.
+
+        :param algos: Имена алгоритмов из _HASH_ALGORITHMS.
+        :param load_content: Прочитать файл целиком (для подстановки содержимого).
+        :param count_stats: Посчитать статистику файла.
+        :return: Статистика файла или None, если она не запрошена.
+        """
 
-            return re.sub(regex, repl, template)
+        algos = list(algos)
+        if load_content and not _is_binary_path(self.path):
+            self.raw_bytes  # чтение файла; значение кэшируется
+        if self.loaded_bytes is not None or (load_content and not algos):
+            for algo in algos:
+                self._file_hash(algo)
+            return self._stats if count_stats else None
 
+        digests, stats = _scan_file(self.path, algos, count_stats)
+        self._hashes.update(digests)
+        return stats
 
     @staticmethod
     def find_placeholders(template: str) -> list[dict[str, Any]]:
@@ -124,9 +527,12 @@ class FileContext:
         }
         """
 
-        regex = r"{([a-zA-Z0-9_]+)(?:\:([^}]+))?}"
+        # Без фигурных скобок плейсхолдеров точно нет — регулярное выражение не нужно
+        if "{" not in template:
+            return []
+
         placeholders = []
-        for match in re.finditer(regex, template):
+        for match in _PLACEHOLDER_RE.finditer(template):
             pattern = match.group(1)
             args = match.group(2).split(";") if match.group(2) else []
             placeholders.append({
@@ -137,116 +543,247 @@ class FileContext:
 
         return placeholders
 
-    @staticmethod
-    def _apply_placeholder(template: str, pattern: str, func, delete_line: bool = False) -> str:
-        """
-        Подставляет результат работы func() вместо плейсхолдера {pattern} в шаблоне.
-        Если delete_line=True, удаляет строку с плейсхолдером.
+    # --- Подстановочные плейсхолдеры: имя → функция(ctx, *args) ---
+    # Если функция вернула None, плейсхолдер остаётся в тексте как есть.
 
-        :param template: Текст шаблона.
-        :param pattern: Имя плейсхолдера.
-        :param func: Функция, возвращающая значение для подстановки.
-        :param delete_line: Флаг удаления строки.
+    _HANDLERS: Dict[str, Callable[..., Any]] = {
+        # --- Информация о файле ---
 
-        :return: Новый текст шаблона.
-        """
+        "name": lambda ctx, *args: os.path.splitext(os.path.basename(ctx.path))[0],
+        "extension": lambda ctx, *args: os.path.splitext(os.path.basename(ctx.path))[1].lstrip("."),
+        "filename": lambda ctx, *args: os.path.basename(ctx.path),
+        "path": lambda ctx, *args: os.path.normpath(ctx.path).replace("/", "\\"),
+        "folder": lambda ctx, *args: os.path.normpath(os.path.dirname(ctx.path)).replace("/", "\\"),
+        "drive": lambda ctx, *args: os.path.splitdrive(ctx.path)[0],
+        "size": lambda ctx, *args: ctx._human_size(ctx.stat.st_size),
+        "hash": lambda ctx, algo="", *args: ctx._file_hash(algo) if algo in _HASH_ALGORITHMS else None,
+        "created": lambda ctx, fmt="%Y-%m-%d %H:%M:%S", *args: datetime.fromtimestamp(ctx.stat.st_ctime).strftime(fmt),
+        "modified": lambda ctx, fmt="%Y-%m-%d %H:%M:%S", *args: datetime.fromtimestamp(ctx.stat.st_mtime).strftime(fmt),
+        "accessed": lambda ctx, fmt="%Y-%m-%d %H:%M:%S", *args: datetime.fromtimestamp(ctx.stat.st_atime).strftime(fmt),
 
-        if delete_line:
-            # Ищем строки с плейсхолдером целиком и удаляем их
-            regex_line = r".*{" + pattern + r"(?:\:[^}]*)?}.*\n?"
-            return re.sub(regex_line, "", template)
-        else:
-            regex = r"{(" + pattern + r")(?:\:([^}]+))?}"
+        # --- Содержимое ---
 
-            def repl(match: re.Match) -> str:
-                args = match.group(2).split(";") if match.group(2) else []
-                return str(func(*args))
+        "content": lambda ctx, mode="", *args: "\n".join(f"{i + 1}: {line}" for i, line in enumerate(ctx.lines)) if mode == "numbered" else ctx.content,
 
-            return re.sub(regex, repl, template)
+        "line": lambda ctx, n="", *args: ctx.lines[int(n) - 1] if n and n.isdigit() and 0 < int(n) <= len(ctx.lines) else "",
+        "lines": lambda ctx, start=None, end=None, *args: ("\n".join(ctx.lines[int(start) - 1:int(end)]) if start and end and start.isdigit() and end.isdigit() else ""),
+        "head": lambda ctx, n="", *args: "\n".join(ctx.lines[:int(n)]) if n and n.isdigit() else "",
+        "tail": lambda ctx, n="", *args: "\n".join(ctx.lines[-int(n):]) if n and n.isdigit() else "",
 
-    def format(self, template: str) -> str:
-        """ Возвращает строку: шаблон с подставленными полями. """
+        "char": lambda ctx, n="", *args: ctx.content[int(n) - 1] if n and n.isdigit() and 0 < int(n) <= len(ctx.content) else "",
+        "chars": lambda ctx, start=None, end=None, *args: (ctx.content[int(start) - 1:int(end)] if start and end and start.isdigit() and end.isdigit() else ""),
+        "headchars": lambda ctx, n="", *args: ctx.content[:int(n)] if n and n.isdigit() else "",
+        "tailchars": lambda ctx, n="", *args: ctx.content[-int(n):] if n and n.isdigit() else "",
 
-        if getattr(self, "skip_file", False):
-            return ""
+        # --- Статистика содержимого ---
 
-        result = template
+        "lines_count": lambda ctx, *args: ctx.lines_count,
+        "words_count": lambda ctx, *args: ctx.words_count,
+        "chars_count": lambda ctx, *args: ctx.chars_count,
+
+        "counter": lambda ctx, *args: ctx.session.files_count,
+        "current_files_count": lambda ctx, *args: ctx.session.files_count,
+        "current_lines_count": lambda ctx, *args: ctx.session.lines_count,
+        "current_words_count": lambda ctx, *args: ctx.session.words_count,
+        "current_chars_count": lambda ctx, *args: ctx.session.chars_count,
+
+        "total_files_count": lambda ctx, *args: ctx.session.total_files,
+        "total_lines_count": lambda ctx, *args: ctx.session.total_lines,
+        "total_words_count": lambda ctx, *args: ctx.session.total_words,
+        "total_chars_count": lambda ctx, *args: ctx.session.total_chars,
+    }
+
+    # --- Символы: постоянные значения, подставляются ещё при разборе шаблона ---
+
+    _CONSTANTS: Dict[str, str] = {
+        "_": " ",
+        "nl": "\n",
+    }
+
+    # --- Трансформация текста (модификаторы содержимого) ---
+    # Применяются к self.content в указанном порядке, независимо от порядка в шаблоне.
+
+    _CONTENT_MODIFIERS: Dict[str, Callable[[str], str]] = {
+        "upper": lambda content: content.upper(),
+        "lower": lambda content: content.lower(),
+        "title": lambda content: content.title(),
+        "remove_linebreaks": lambda content: content.replace("\n", ""),
+        # filter со str.strip отбирает непустые строки на C, без генератора на Python
+        "remove_blank_lines": lambda content: "\n".join(filter(str.strip, content.splitlines())),
+        "remove_whitespaces": lambda content: " ".join(content.split()),
+        "remove_spaces": lambda content: content.replace(" ", ""),
+    }
+
+    # Обработчик плейсхолдеров, которые ничего не выводят (модификаторы содержимого)
+    _NO_OUTPUT: Callable[..., str] = staticmethod(lambda ctx, *args: "")
+
+    # Плейсхолдеры, читающие self.content (и потому зависящие от модификаторов)
+    _CONTENT_READERS = frozenset({"content", "char", "chars", "headchars", "tailchars"})
 
-        # --- Информация о файле ---
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def compile_template(template: str) -> tuple:
+        """
+        Разбирает шаблон один раз и возвращает его в виде последовательности сегментов:
+        строка — текст как есть, кортеж (имя, аргументы, исходный текст, обработчик) — плейсхолдер.
+        Обработчик выбирается здесь же, чтобы при подстановке не искать его для каждого файла;
+        None означает неизвестный плейсхолдер, который остаётся в тексте как есть.
+
+        Строки с {x} удаляются, а символы {_} и {nl} подставляются уже здесь, так как зависят только от шаблона.
+        Результат кэшируется: при объединении многих файлов шаблон разбирается единожды.
+        """
+
+        # Без плейсхолдеров шаблон выводится как есть — разбирать нечего
+        if "{" not in template:
+            return (template,) if template else ()
+
+        # --- Разбор шаблона: строки текста и плейсхолдеры (имя, аргументы, исходный текст) ---
+
+        segments: list = []
+        pos = 0
+        for match in _PLACEHOLDER_RE.finditer(template):
+            if match.start() > pos:
+                segments.append(template[pos:match.start()])
+            name = match.group(1)
+            args = tuple(match.group(2).split(";")) if match.group(2) else ()
+            if name in FileContext._CONTENT_MODIFIERS:
+                # Модификаторы применяются к содержимому заранее, сами в текст ничего не выводят
+                handler = FileContext._NO_OUTPUT
+            else:
+                handler = FileContext._HANDLERS.get(name)
+            segments.append((name, args, match.group(0), handler))
+            pos = match.end()
+        if pos < len(template):
+            segments.append(template[pos:])
+
+        # --- {x}: удаляем строки шаблона целиком (перевод строки — "\n" или {nl}) ---
+
+        if "{x" in template and any(isinstance(seg, tuple) and seg[0] == "x" for seg in segments):
+            kept: list = []
+            line: list = []
+            delete_line = False
+            for seg in segments:
+                if isinstance(seg, str):
+                    pieces = seg.split("\n")
+                    for piece in pieces[:-1]:
+                        if piece:
+                            line.append(piece)
+                        if not delete_line:
+                            kept.extend(line)
+                            kept.append("\n")
+                        line, delete_line = [], False
+                    if pieces[-1]:
+                        line.append(pieces[-1])
+                elif seg[0] == "nl":
+                    if not delete_line:
+                        kept.extend(line)
+                        kept.append(seg)
+                    line, delete_line = [], False
+                else:
+                    line.append(seg)
+                    delete_line = delete_line or seg[0] == "x"
+            if not delete_line:
+                kept.extend(line)
+            segments = kept
+
+        # --- Символы ({_}, {nl}) заменяем текстом и склеиваем соседние строки ---
+
+        folded: list = []
+        for seg in segments:
+            if isinstance(seg, tuple) and seg[0] in FileContext._CONSTANTS:
+                seg = FileContext._CONSTANTS[seg[0]]
+            if isinstance(seg, str) and folded and isinstance(folded[-1], str):
+                folded[-1] += seg
+            else:
+                folded.append(seg)
+
+        return tuple(folded)
 
-        result = self._apply_placeholder(result, "name", lambda *args: os.path.splitext(os.path.basename(self.path))[0])
-        result = self._apply_placeholder(result, "extension", lambda *args: os.path.splitext(os.path.basename(self.path))[1].lstrip("."))
-        result = self._apply_placeholder(result, "filename", lambda *args: os.path.basename(self.path))
-        result = self._apply_placeholder(result, "path", lambda *args: os.path.normpath(self.path).replace("/", "\\"))
-        result = self._apply_placeholder(result, "folder", lambda *args: os.path.normpath(os.path.dirname(self.path)).replace("/", "\\"))
-        result = self._apply_placeholder(result, "drive", lambda *args: os.path.splitdrive(self.path)[0])
-        result = self._apply_placeholder(result, "size", lambda *args: self._human_size(os.path.getsize(self.path)))
-        result = self._apply_placeholder(result, "hash:md5", lambda *args: hashlib.md5(open(self.path, "rb").read()).hexdigest())
-        result = self._apply_placeholder(result, "hash:sha1", lambda *args: hashlib.sha1(open(self.path, "rb").read()).hexdigest())
-        result = self._apply_placeholder(result, "created", lambda fmt="%Y-%m-%d %H:%M:%S": datetime.fromtimestamp(os.stat(self.path).st_ctime).strftime(fmt))
-        result = self._apply_placeholder(result, "modified", lambda fmt="%Y-%m-%d %H:%M:%S": datetime.fromtimestamp(os.stat(self.path).st_mtime).strftime(fmt))
-        result = self._apply_placeholder(result, "accessed", lambda fmt="%Y-%m-%d %H:%M:%S": datetime.fromtimestamp(os.stat(self.path).st_atime).strftime(fmt))
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def placeholder_names(template: str) -> frozenset[str]:
+        """ Возвращает множество имён плейсхолдеров шаблона (без удалённых строк с {x}); результат кэшируется. """
 
-        # --- Символы ---
+        return frozenset(seg[0] for seg in FileContext.compile_template(template) if isinstance(seg, tuple))
 
-        result = self._apply_placeholder(result, '_', lambda *args: " ")
-        result = self._apply_placeholder(result, 'nl', lambda *args: "\n")
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def required_lines(template: str) -> Optional[int]:
+        """
+        Возвращает, сколько первых строк файла достаточно для шаблона, или None, если нужен весь файл.
+        Ограничение есть, только если из содержимого шаблон использует лишь {head:N}, {line:N} и {lines:A;B}.
+        Результат кэшируется.
+        """
 
-        result = self._apply_placeholder(result, 'x', lambda *args: "", delete_line=True)
+        names = FileContext.placeholder_names(template)
+        if not (names & _CONTENT_PLACEHOLDERS) <= _HEAD_LINE_PLACEHOLDERS:
+            return None
+
+        limit = 0
+        for seg in FileContext.compile_template(template):
+            if isinstance(seg, tuple) and seg[0] in _HEAD_LINE_PLACEHOLDERS:
+                # {lines:0;B} берёт срез lines[-1:B]: он зависит от длины всего файла
+                if seg[0] == "lines" and len(seg[1]) > 1 and seg[1][0].isdigit() and seg[1][1].isdigit() \
+                        and int(seg[1][0]) < 1:
+                    return None
+                # Номер последней нужной строки; нечисловые аргументы дают пустой вывод
+                n = seg[1][1] if seg[0] == "lines" and len(seg[1]) > 1 else (seg[1][0] if seg[1] else "")
+                if n.isdigit():
+                    limit = max(limit, int(n))
+        return limit
 
-        # --- Трансформация текста (модификаторы содержимого) ---
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def content_modifiers(template: str) -> Tuple[Callable[[str], str], ...]:
+        """
+        Возвращает модификаторы содержимого шаблона в порядке применения; результат кэшируется.
+        Если шаблон не выводит содержимое, модифицировать нечего — кортеж пуст.
+        """
 
-        result = self._apply_content_modifier(result, "upper", lambda ctx: ctx.content.upper())
-        result = self._apply_content_modifier(result, "lower", lambda ctx: ctx.content.lower())
-        result = self._apply_content_modifier(result, "title", lambda ctx: ctx.content.title())
-        result = self._apply_content_modifier(result, "remove_linebreaks", lambda ctx: ctx.content.replace("\n", ""))
-        result = self._apply_content_modifier(result, "remove_blank_lines", lambda ctx: "\n".join(line for line in ctx.content.splitlines() if line.strip()))
-        result = self._apply_content_modifier(result, "remove_whitespaces", lambda ctx: " ".join(ctx.content.split()))
-        result = self._apply_content_modifier(result, "remove_spaces", lambda ctx: ctx.content.replace(" ", ""))
+        names = FileContext.placeholder_names(template)
+        if names.isdisjoint(FileContext._CONTENT_READERS):
+            return ()
+        return tuple(func for modifier, func in FileContext._CONTENT_MODIFIERS.items() if modifier in names)
 
-        # --- Содержимое ---
+    def format(self, template: str) -> str:
+        """
+        Возвращает строку: шаблон с подставленными полями.
 
-        result = self._apply_placeholder(result, "content:numbered", lambda *args: "\n".join(f"{i + 1}: {line}" for i, line in enumerate(self.lines)))
-        result = self._apply_placeholder(result, "content", lambda *args: self.content)
+        Шаблон разбирается один раз (см. compile_template), а каждый плейсхолдер
+        передаётся своему обработчику из _HANDLERS.
+        """
 
-        result = self._apply_placeholder(result, "line", lambda n: self.lines[int(n) - 1] if n and n.isdigit() and 0 < int(n) <= len(self.lines) else "")
-        result = self._apply_placeholder(result, "lines", lambda start=None, end=None, *args: ("\n".join(self.lines[int(start) - 1:int(end)]) if start and end and start.isdigit() and end.isdigit() else ""))
-        result = self._apply_placeholder(result, "head", lambda n: "\n".join(self.lines[:int(n)]) if n and n.isdigit() else "")
-        result = self._apply_placeholder(result, "tail", lambda n: "\n".join(self.lines[-int(n):]) if n and n.isdigit() else "")
+        if getattr(self, "skip_file", False):
+            return ""
 
-        result = self._apply_placeholder(result, "char", lambda n: self.content[int(n) - 1] if n and n.isdigit() and 0 < int(n) <= len(self.content) else "")
-        result = self._apply_placeholder(result, "chars", lambda start=None, end=None, *args: (self.content[int(start) - 1:int(end)] if start and end and start.isdigit() and end.isdigit()  else ""))
-        result = self._apply_placeholder(result, "headchars", lambda n: self.content[:int(n)] if n and n.isdigit() else "")
-        result = self._apply_placeholder(result, "tailchars", lambda n: self.content[-int(n):] if n and n.isdigit() else "")
+        segments = self.compile_template(template)
 
-        # --- Статистика содержимого ---
+        # --- Модификаторы содержимого применяются до подстановки ---
 
-        result = self._apply_placeholder(result, "lines_count", lambda *args: self.lines_count)
-        result = self._apply_placeholder(result, "words_count", lambda *args: self.words_count)
-        result = self._apply_placeholder(result, "chars_count", lambda *args: self.chars_count)
+        for func in self.content_modifiers(template):
+            self.content = func(self.content)
 
-        result = self._apply_placeholder(result, "counter", lambda *args: self.files_counter)
-        result = self._apply_placeholder(result, "current_files_count", lambda *args: self.current_files_count)
-        result = self._apply_placeholder(result, "current_lines_count", lambda *args: self.current_lines_count)
-        result = self._apply_placeholder(result, "current_words_count", lambda *args: self.current_words_count)
-        result = self._apply_placeholder(result, "current_chars_count", lambda *args: self.current_chars_count)
+        # --- Подстановка ---
 
-        result = self._apply_placeholder(result, "total_files_count", lambda *args: self.total_files)
-        result = self._apply_placeholder(result, "total_lines_count", lambda *args: self.total_lines)
-        result = self._apply_placeholder(result, "total_words_count", lambda *args: self.total_words)
-        result = self._apply_placeholder(result, "total_chars_count", lambda *args: self.total_chars)
+        parts: List[str] = []
+        append = parts.append
+        for seg in segments:
+            if isinstance(seg, str):
+                append(seg)
+                continue
+            _, args, full, handler = seg
+            value = handler(self, *args) if handler is not None else None
+            append(full if value is None else str(value))
 
-        return result
+        return "".join(parts)
 
     @staticmethod
     def _human_size(size: int) -> str:
-        for unit in ["Б", "КБ", "МБ", "ГБ", "ТБ"]:
-            if size < 1024:
-                if unit == "Б":
-                    return f"{size} {unit}"
-                else:
-                    return f"{size:.2f} {unit}"
-            size /= 1024
+        # Номер единицы — это log1024 размера, его даёт длина числа в битах; без цикла делений
+        idx = min((size.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1) if size else 0
+        if idx == 0:
+            return f"{size} {_SIZE_UNITS[0]}"
+        return f"{size / (1 << (idx * 10)):.2f} {_SIZE_UNITS[idx]}"
 
 class FGlueApp:
     """ Главный класс GUI‑приложения на tkinter. """
@@ -259,16 +796,35 @@ class FGlueApp:
         self.root.minsize(640, 480)
 
         self.folder_path = folder_path
-        # Переключатели выбора для каждого пути
-        self.check_vars: Dict[str, tk.BooleanVar] = {}
+        # Состояние выбора для каждого пути (обычные bool: к виджетам они не привязаны,
+        # поэтому tk.BooleanVar с его переменной на стороне Tcl здесь не нужен)
+        self.checked: Dict[str, bool] = {}
         # Сопоставление путь → id узла для быстрого обновления подписи
         self.path_to_item: Dict[str, str] = {}
-        # Шаблоны: ключ — отображаемое имя без расширения, значение — содержимое
-        self.templates: Dict[str, str] = {}
+        # Обратное сопоставление id узла → путь; values узла не запрашиваются у Tk
+        self.item_to_path: Dict[str, str] = {}
+        # Папки дерева; по ним узлы отличаются от файлов без обращения к диску
+        self.dir_paths: set[str] = set()
+        # Плоский список файлов дерева (без папок) в порядке отображения
+        self.file_paths: List[str] = []
+        # Файлы, отфильтрованные по расширению; пересчитывается при смене фильтров
+        self.filtered_paths: set[str] = set()
+        # Расширения файлов в нижнем регистре, считаются один раз при загрузке дерева
+        self.file_exts: Dict[str, str] = {}
+        # Шаблоны: ключ — отображаемое имя без расширения, значение — (содержимое, найденные плейсхолдеры)
+        self.templates: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+        # Байты файлов из прошлых объединений: путь → ((st_mtime_ns, st_size), байты);
+        # неизменённые файлы при повторном объединении не перечитываются
+        self.file_cache: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+        # Прочитанные файлы шаблонов: путь → (st_mtime_ns, содержимое, плейсхолдеры);
+        # неизменённые не перечитываются и не разбираются заново
+        self.template_cache: Dict[str, Tuple[int, str, List[Dict[str, Any]]]] = {}
         self.selected_template = tk.StringVar()
 
         # Строка статуса (кол-во выбранных/всего файлов)
         self.status_var = tk.StringVar(value="")
+        # Число выбранных и не отфильтрованных файлов; при кликах меняется на ±1 без пересчёта
+        self.selected_count = 0
 
         # Исключённые расширения как множество, например: {".log", ".tmp"}
         self.excluded_exts: set[str] = set()
@@ -398,14 +954,20 @@ class FGlueApp:
     def _is_ext_excluded(self, path: str) -> bool:
         """ True, если расширение файла входит в список исключённых. """
 
-        _, ext = os.path.splitext(path)
-        return ext.lower() in self.excluded_exts
+        return self._file_ext(path) in self.excluded_exts
+
+    def _file_ext(self, path: str) -> str:
+        """ Расширение файла в нижнем регистре; для файлов дерева берётся из кэша. """
+
+        ext = self.file_exts.get(path)
+        if ext is None:
+            ext = os.path.splitext(path)[1].lower()
+        return ext
 
     def _is_filtered_out(self, path: str) -> bool:
         """ True, если файл должен быть отфильтрован по расширению. """
 
-        _, ext = os.path.splitext(path)
-        ext = ext.lower()
+        ext = self._file_ext(path)
         if ext in self.excluded_exts:
             return True
         if self.included_exts and (ext not in self.included_exts):
@@ -428,25 +990,28 @@ class FGlueApp:
         """ Применяет оба фильтра расширений: исключение и белый список. """
 
         # Пройтись по всем элементам и обновить состояние/теги
-        for path, var in self.check_vars.items():
-            item_id = self.path_to_item.get(path)
-            if not item_id:
-                continue
-            if os.path.isdir(path):
-                self._refresh_item_label(item_id, path)
-                self.tree.item(item_id, tags=())
-            else:
-                if self._is_filtered_out(path):
-                    var.set(False)
-                    self._refresh_item_label(item_id, path)
-                    _, ext = os.path.splitext(path)
-                    ext_l = ext.lower()
-                    if ext_l in self.excluded_exts:
-                        self.tree.item(item_id, tags=("excluded_ext",))
-                    else:
-                        self.tree.item(item_id, tags=("not_included_ext",))
-                else:
+        with self._tree_detached():
+            for path in self.checked:
+                item_id = self.path_to_item.get(path)
+                if not item_id:
+                    continue
+                if path in self.dir_paths:
+                    # Состояние папок фильтры не меняют — подпись прежняя, обновляем только теги
                     self.tree.item(item_id, tags=())
+                else:
+                    if self._is_filtered_out(path):
+                        self.filtered_paths.add(path)
+                        # Подпись меняется, только если галочка действительно снимается
+                        if self.checked[path]:
+                            self.checked[path] = False
+                            self._refresh_item_label(item_id, path)
+                        if self._file_ext(path) in self.excluded_exts:
+                            self.tree.item(item_id, tags=("excluded_ext",))
+                        else:
+                            self.tree.item(item_id, tags=("not_included_ext",))
+                    else:
+                        self.filtered_paths.discard(path)
+                        self.tree.item(item_id, tags=())
         self._update_status()
 
     def reset_excluded_exts(self) -> None:
@@ -478,87 +1043,110 @@ class FGlueApp:
         # Не трогаем, если клик по индикатору/иконке
         if element in ("Treeitem.indicator", "Treeitem.image"):
             return
-        abspath = self.tree.item(item_id, "values")[0]
+        abspath = self.item_to_path[item_id]
         # Файлы, отфильтрованные по расширению, не переключаем
-        if os.path.isfile(abspath) and self._is_filtered_out(abspath):
+        if abspath in self.filtered_paths:
             return
-        var = self.check_vars.get(abspath)
-        if var is None:
+        checked = self.checked.get(abspath)
+        if checked is None:
             return
-        new_state = not var.get()
-        if os.path.isdir(abspath):
+        new_state = not checked
+        if abspath in self.dir_paths:
             # Для папки — переключаем всех потомков, но пропускаем отфильтрованные расширения
             self._set_state_recursive(item_id, new_state)
         else:
             self._set_item_state(item_id, abspath, new_state)
-        self._update_status()
+        # Счётчик уже обновлён по одному в _set_item_state
+        self._update_status(recount=False)
+
+    @contextlib.contextmanager
+    def _tree_detached(self) -> Iterator[None]:
+        """
+        Отцепляет корневые узлы дерева (detach) на время массового обновления подписей и тегов
+        и возвращает их на прежние позиции в прежнем порядке, даже если обновление завершилось ошибкой.
+        Поддеревья и их состояние (раскрытие, подписи, теги) при этом сохраняются.
+        """
+
+        top_items = self.tree.get_children("")
+        self.tree.detach(*top_items)
+        try:
+            yield
+        finally:
+            for index, item_id in enumerate(top_items):
+                self.tree.reattach(item_id, "", index)
 
     def _refresh_item_label(self, item_id: str, abspath: str) -> None:
         """ Обновляет подпись узла (префикс чекбокса + имя файла/папки). """
 
         base = os.path.basename(abspath)
-        checked = bool(self.check_vars.get(abspath, tk.BooleanVar(value=True)).get())
+        checked = self.checked.get(abspath, True)
         self.tree.item(item_id, text=self._checkbox_prefix(checked) + base)
 
     def _set_item_state(self, item_id: str, abspath: str, state: bool) -> None:
         """ Устанавливает состояние выбора для одного узла и обновляет подпись. """
 
-        var = self.check_vars.get(abspath)
-        if var is not None:
-            var.set(state)
+        old_state = self.checked.get(abspath)
+        if old_state is not None:
+            self.checked[abspath] = state
+            if (old_state != state and abspath not in self.dir_paths
+                    and abspath not in self.filtered_paths):
+                self.selected_count += 1 if state else -1
         self._refresh_item_label(item_id, abspath)
 
     def _set_state_recursive(self, item_id: str, state: bool) -> None:
         """
-        Рекурсивно меняет состояние узла и всех его потомков.
+        Меняет состояние узла и всех его потомков.
+        Обход идёт по явному стеку, поэтому глубина дерева не ограничена глубиной рекурсии.
 
         Исключённые по расширению файлы пропускаются.
         """
 
-        abspath = self.tree.item(item_id, "values")[0]
-        # Пропускаем файлы, отфильтрованные по расширению
-        if os.path.isfile(abspath) and self._is_filtered_out(abspath):
-            return
-        self._set_item_state(item_id, abspath, state)
-        for child in self.tree.get_children(item_id):
-            self._set_state_recursive(child, state)
+        stack = [item_id]
+        while stack:
+            node = stack.pop()
+            abspath = self.item_to_path[node]
+            # Пропускаем файлы, отфильтрованные по расширению
+            if abspath in self.filtered_paths:
+                continue
+            self._set_item_state(node, abspath, state)
+            if abspath in self.dir_paths:
+                stack.extend(self.tree.get_children(node))
 
     def _set_all(self, state: bool) -> None:
         """ Глобально включает/выключает выбор у всех элементов, кроме отфильтрованных. """
 
-        for path, var in self.check_vars.items():
-            # Отфильтрованные расширения всегда остаются снятыми
-            if os.path.isfile(path) and self._is_filtered_out(path):
-                var.set(False)
-            else:
-                var.set(state)
-            item_id = self.path_to_item.get(path)
-            if item_id:
-                # Теги не меняем здесь — ими управляет apply/reset
-                self._refresh_item_label(item_id, path)
+        with self._tree_detached():
+            for path, old_state in self.checked.items():
+                # Отфильтрованные расширения всегда остаются снятыми
+                new_state = state and path not in self.filtered_paths
+                # Узлы, состояние которых не меняется, не трогаем: каждый вызов tree.item — обращение к Tk
+                if new_state == old_state:
+                    continue
+                self.checked[path] = new_state
+                item_id = self.path_to_item.get(path)
+                if item_id:
+                    # Теги не меняем здесь — ими управляет apply/reset
+                    self._refresh_item_label(item_id, path)
         self._update_status()
 
-    def expand_all(self) -> None:
-        """ Рекурсивно раскрывает все узлы дерева. """
+    def _set_all_open(self, is_open: bool) -> None:
+        """
+        Раскрывает или сворачивает все узлы дерева.
+        Потомки есть только у папок, поэтому обход дерева не нужен: папки известны по dir_paths.
+        """
 
-        def recurse(node: str):
-            self.tree.item(node, open=True)
-            for child in self.tree.get_children(node):
-                recurse(child)
+        for path in self.dir_paths:
+            self.tree.item(self.path_to_item[path], open=is_open)
 
-        for top_node in self.tree.get_children(""):
-            recurse(top_node)
+    def expand_all(self) -> None:
+        """ Раскрывает все узлы дерева. """
 
-    def collapse_all(self) -> None:
-        """ Рекурсивно сворачивает все узлы дерева. """
+        self._set_all_open(True)
 
-        def recurse(node: str):
-            self.tree.item(node, open=False)
-            for child in self.tree.get_children(node):
-                recurse(child)
+    def collapse_all(self) -> None:
+        """ Сворачивает все узлы дерева. """
 
-        for top_node in self.tree.get_children(""):
-            recurse(top_node)
+        self._set_all_open(False)
 
     def _on_select_all(self) -> None:
         """ Ctrl+A: выбрать все. """
@@ -587,7 +1175,7 @@ class FGlueApp:
         sel = self.tree.selection()
         if not sel:
             return
-        abspath = self.tree.item(sel[0], "values")[0]
+        abspath = self.item_to_path[sel[0]]
         path = abspath
         self._open_in_os(path)
 
@@ -597,7 +1185,7 @@ class FGlueApp:
         sel = self.tree.selection()
         if not sel:
             return
-        abspath = self.tree.item(sel[0], "values")[0]
+        abspath = self.item_to_path[sel[0]]
         folder = abspath if os.path.isdir(abspath) else os.path.dirname(abspath)
         if not folder:
             folder = os.path.dirname(abspath)
@@ -620,24 +1208,44 @@ class FGlueApp:
         """ Перезаполняет дерево файлов, начиная с указанного пути. """
 
         self.tree.delete(*self.tree.get_children())
-        self.check_vars.clear()
+        self.checked.clear()
         self.path_to_item.clear()
+        self.item_to_path.clear()
+        self.dir_paths.clear()
+        self.file_paths.clear()
+        self.filtered_paths.clear()
+        self.file_exts.clear()
+
+        # по умолчанию все выбраны: префикс подписи один для всех узлов
+        checked_prefix = self._checkbox_prefix(True)
 
-        def insert_node(parent: str, abspath: str) -> None:
+        def insert_node(parent: str, abspath: str, is_dir: bool) -> None:
             """ Вставляет в дерево узел для пути и рекурсивно добавляет потомков. """
 
-            name = os.path.basename(abspath)
-            # по умолчанию все выбраны
-            self.check_vars[abspath] = tk.BooleanVar(value=True)
-            label = self._checkbox_prefix(True) + name
-            node = self.tree.insert(parent, "end", text=label, open=(parent == ""), values=(abspath,))
+            self.checked[abspath] = True
+            label = checked_prefix + os.path.basename(abspath)
+            # Раскрыт только корень; для остальных open не передаём — по умолчанию узел свёрнут
+            if parent:
+                node = self.tree.insert(parent, "end", text=label, values=(abspath,))
+            else:
+                node = self.tree.insert(parent, "end", text=label, open=True, values=(abspath,))
             self.path_to_item[abspath] = node
+            self.item_to_path[node] = abspath
+
+            if is_dir:
+                self.dir_paths.add(abspath)
+                # os.scandir отдаёт тип записи вместе с именем — без отдельного stat на каждый путь
+                with os.scandir(abspath) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+                for entry in entries:
+                    insert_node(node, entry.path, entry.is_dir())
+            else:
+                self.file_paths.append(abspath)
+                self.file_exts[abspath] = os.path.splitext(abspath)[1].lower()
+                if self._is_filtered_out(abspath):
+                    self.filtered_paths.add(abspath)
 
-            if os.path.isdir(abspath):
-                for item in sorted(os.listdir(abspath)):
-                    insert_node(node, os.path.join(abspath, item))
-
-        insert_node("", path)
+        insert_node("", path, os.path.isdir(path))
         # Если уже заданы фильтры расширений, применим их
         if self.excluded_exts or self.included_exts:
             self.apply_extension_filters()
@@ -647,47 +1255,38 @@ class FGlueApp:
     def get_selected_files(self) -> List[str]:
         """ Возвращает список путей файлов, которые отмечены галочкой и не исключены. """
 
-        selected: List[str] = []
+        # Отфильтрованные расширения — всегда пропускаем
+        return [path for path in self.file_paths
+                if path not in self.filtered_paths and self.checked[path]]
 
-        def walk(node: str) -> None:
-            for child in self.tree.get_children(node):
-                abspath = self.tree.item(child, "values")[0]
-                if os.path.isdir(abspath):
-                    walk(child)
-                else:
-                    # Отфильтрованные расширения — всегда пропускаем
-                    if self._is_filtered_out(abspath):
-                        continue
-                    var = self.check_vars.get(abspath)
-                    if var is None or var.get():
-                        selected.append(abspath)
-
-        walk("")
-        return selected
-
-    def _update_status(self) -> None:
-        """ Обновляет строку статуса: выбрано/всего файлов. """
-
-        total_files = 0
-        def count_files(node: str) -> None:
-            nonlocal total_files
-            for child in self.tree.get_children(node):
-                abspath = self.tree.item(child, "values")[0]
-                if os.path.isdir(abspath):
-                    count_files(child)
-                else:
-                    total_files += 1
-        count_files("")
-        selected_files = len(self.get_selected_files())
-        self.status_var.set(f"Выбрано файлов: {selected_files} / {total_files}")
+    def _update_status(self, recount: bool = True) -> None:
+        """
+        Обновляет строку статуса: выбрано/всего файлов.
+
+        :param recount: Пересчитать выбранные файлы заново (после массовых изменений);
+                        иначе используется счётчик, поддерживаемый _set_item_state.
+        """
+
+        total_files = len(self.file_paths)
+        if recount:
+            self.selected_count = sum(1 for path in self.file_paths
+                                      if path not in self.filtered_paths and self.checked[path])
+        self.status_var.set(f"Выбрано файлов: {self.selected_count} / {total_files}")
 
     def _load_templates(self) -> None:
-        """ Загружает шаблоны из папки templates/ и подготавливает список выбора. """
+        """
+        Загружает шаблоны из папки templates/ и подготавливает список выбора.
+        Вызывается при запуске и при обновлении (F5): неизменённые файлы шаблонов не перечитываются,
+        выбранный шаблон остаётся выбранным, если он ещё существует.
+        """
 
         templates_dir = "templates"
         os.makedirs(templates_dir, exist_ok=True)
 
-        if not os.listdir(templates_dir):
+        # Для проверки на пустоту достаточно первой записи, весь список не нужен
+        with os.scandir(templates_dir) as it:
+            is_empty = next(it, None) is None
+        if is_empty:
             with open(os.path.join(templates_dir, "1. Содержимой с шапкой.txt"), "w", encoding="utf-8") as f:
                 f.write("----- {filename} -----{nl}{content}{nl}")
             with open(os.path.join(templates_dir, "2. Cодержимое с шапкой и нумерацией.txt"), "w", encoding="utf-8") as f:
@@ -728,20 +1327,44 @@ class FGlueApp:
                 f.write("{counter}. {path}{nl}")
 
         # Загружаем файлы шаблонов: ключ — имя без расширения
+        selected = self.selected_template.get()
         self.templates.clear()
-        for fname in os.listdir(templates_dir):
-            fpath = os.path.join(templates_dir, fname)
-            if os.path.isfile(fpath):
-                name_wo_ext, _ = os.path.splitext(fname)
-                display = name_wo_ext
-                # Если имя без расширения уже занято, делаем уникальным
-                while display in self.templates:
-                    display += "_"
-                with open(fpath, "r", encoding="utf-8") as f:
-                    self.templates[display] = f.read()
+        cache: Dict[str, Tuple[int, str, List[Dict[str, Any]]]] = {}
+        # Имя без расширения → сколько "_" пробовать дописать при следующем совпадении
+        suffix_counts: Dict[str, int] = {}
+        # os.scandir отдаёт тип записи вместе с именем: os.path.isfile на каждый файл не нужен
+        with os.scandir(templates_dir) as it:
+            entries = [entry for entry in it if entry.is_file()]
+        for entry in entries:
+            try:
+                mtime_ns: Optional[int] = entry.stat().st_mtime_ns
+            except OSError:
+                # Без времени изменения файл просто читается заново и не кэшируется
+                mtime_ns = None
+            name_wo_ext, _ = os.path.splitext(entry.name)
+            # Если имя без расширения уже занято, делаем уникальным, дописывая "_".
+            # Перебор продолжается с места, где остановился для этого имени в прошлый раз
+            n = suffix_counts.get(name_wo_ext, 0)
+            display = name_wo_ext + "_" * n
+            while display in self.templates:
+                n += 1
+                display = name_wo_ext + "_" * n
+            suffix_counts[name_wo_ext] = n + 1
+            # Файл читаем и разбираем, только если он изменился с прошлой загрузки
+            cached = self.template_cache.get(entry.path)
+            if cached is None or mtime_ns is None or cached[0] != mtime_ns:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                cached = (mtime_ns, content, FileContext.find_placeholders(content))
+            if mtime_ns is not None:
+                cache[entry.path] = cached
+            self.templates[display] = cached[1:]
+        self.template_cache = cache
 
         self.template_combo["values"] = list(self.templates.keys())
-        if self.templates:
+        if selected in self.templates:
+            self.selected_template.set(selected)
+        elif self.templates:
             self.template_combo.current(0)
 
     def choose_folder(self) -> None:
@@ -754,8 +1377,9 @@ class FGlueApp:
             self._update_status()
 
     def refresh_files(self) -> None:
-        """ Обновляет содержимое дерева текущей папки и повторно применяет фильтры. """
+        """ Перечитывает шаблоны, обновляет содержимое дерева текущей папки и повторно применяет фильтры. """
 
+        self._load_templates()
         if not self.folder_path:
             return
         self._load_files(self.folder_path)
@@ -764,98 +1388,185 @@ class FGlueApp:
     def merge_files(self) -> None:
         """ Формирует объединённый текст по текущему шаблону и выбранным файлам. """
 
-        FileContext.reset_counters()
-
         template_name = self.selected_template.get()
         if not template_name:
             messagebox.showwarning("Внимание", "Выберите шаблон!")
             return
 
-        template = self.templates[template_name]
+        # Плейсхолдеры найдены ещё при загрузке шаблона
+        template, placeholders = self.templates[template_name]
         selected_files = self.get_selected_files()
-        placeholders = FileContext.find_placeholders(template)
-
-        # --- {skip_ext:ext1;ext2;...} ---
-
-        skip_exts = []
-        for p in [p for p in placeholders if p["pattern"] == "skip_ext"]:
-            for arg in p["args"]:
-                if arg.strip():
-                    skip_exts.append(arg.lower())
-        if skip_exts:
-            skip_exts_set = set(ext if ext.startswith(".") else "." + ext for ext in skip_exts)
-            selected_files = [f for f in selected_files if os.path.splitext(f)[1].lower() not in skip_exts_set]
-            for ph in [p for p in placeholders if p["pattern"] == "skip_ext"]:
-                template = template.replace(ph["full"], "")
-
-        # --- {allow_ext:ext1;ext2;...} ---
-
-        allow_exts = []
-        for p in [p for p in placeholders if p["pattern"] == "allow_ext"]:
-            for arg in p["args"]:
-                if arg.strip():
-                    allow_exts.append(arg.lower())
-        if allow_exts:
-            allow_exts_set = set(ext if ext.startswith(".") else "." + ext for ext in allow_exts)
-            selected_files = [f for f in selected_files if os.path.splitext(f)[1].lower() in allow_exts_set]
-            for ph in [p for p in placeholders if p["pattern"] == "allow_ext"]:
-                template = template.replace(ph["full"], "")
+
+        # Группируем плейсхолдеры по имени за один проход
+        by_pattern: Dict[str, List[Dict[str, Any]]] = {}
+        for p in placeholders:
+            by_pattern.setdefault(p["pattern"], []).append(p)
+
+        # Управляющие плейсхолдеры, которые нужно убрать из шаблона
+        to_strip: List[str] = []
+
+        # --- {skip_ext:ext1;ext2;...} и {allow_ext:ext1;ext2;...} ---
+
+        def ext_set(name: str) -> frozenset:
+            exts = (arg.lower() for p in by_pattern.get(name, ()) for arg in p["args"] if arg.strip())
+            return frozenset(ext if ext.startswith(".") else "." + ext for ext in exts)
+
+        skip_exts_set = ext_set("skip_ext")
+        allow_exts_set = ext_set("allow_ext")
+        if skip_exts_set or allow_exts_set:
+            # Расширение каждого файла вычисляем один раз, оба фильтра — за один проход
+            exts = [os.path.splitext(f)[1].lower() for f in selected_files]
+            selected_files = [f for f, ext in zip(selected_files, exts)
+                              if ext not in skip_exts_set and (not allow_exts_set or ext in allow_exts_set)]
+        if skip_exts_set:
+            to_strip.extend(p["full"] for p in by_pattern["skip_ext"])
+        if allow_exts_set:
+            to_strip.extend(p["full"] for p in by_pattern["allow_ext"])
 
         # --- {limit_files:n} ---
 
-        limit_ph = next((p for p in placeholders if p["pattern"] == "limit_files"), None)
+        limit_ph = by_pattern.get("limit_files", [None])[0]
         if limit_ph and limit_ph["args"]:
             limit = int(limit_ph["args"][0])
             selected_files = selected_files[:limit]
-            template = template.replace(limit_ph["full"], "")
+            to_strip.append(limit_ph["full"])
 
-        # --- Подсчитаем итоговые значения по всем выбранным файлам ---
+        if not selected_files:
+            # Объединять нечего: файлы не читаются, шаблон не разбирается
+            self._show_preview("")
+            return
 
-        FileContext.total_files = len(selected_files)
+        for full in dict.fromkeys(to_strip):
+            template = template.replace(full, "")
+
+        # Варианты шаблона готовим один раз, а не для каждого файла
+        lowered = template.lower()
+        if "{show_before}" not in lowered and "{show_after}" not in lowered:
+            # Маркеров нет — все варианты совпадают с шаблоном, регулярные выражения не нужны
+            template_first = template_last = template_middle = template
+        elif len(selected_files) == 1:
+            # Единственный файл считается первым: остальные варианты не понадобятся
+            template_first = _SHOW_BEFORE_RE.sub("", _remove_marker_lines(template, "{show_after}"))
+            template_last = template_middle = template_first
+        else:
+            # Первый файл: убираем show_after
+            template_first = _SHOW_BEFORE_RE.sub("", _remove_marker_lines(template, "{show_after}"))
+            # Последний файл: убираем show_before
+            template_last = _remove_marker_lines(_SHOW_AFTER_RE.sub("", template), "{show_before}")
+            # "Средние" файлы: убираем и show_before, и show_after
+            template_middle = _remove_marker_lines(template, "{show_before}", "{show_after}")
+
+        # Шаблон без плейсхолдеров выводит один и тот же текст для каждого файла:
+        # файлы не читаются, контексты не создаются
+        compiled = [FileContext.compile_template(t) for t in (template_first, template_middle, template_last)]
+        if all(isinstance(seg, str) for segments in compiled for seg in segments):
+            first, middle, last = ("".join(segments) for segments in compiled)
+            if len(selected_files) == 1:
+                self._show_preview(first)
+            else:
+                self._show_preview(first + middle * (len(selected_files) - 2) + last)
+            return
 
-        total_lines_sum = 0
-        total_words_sum = 0
-        total_chars_sum = 0
+        session = MergeSession(total_files=len(selected_files))
+        names = FileContext.placeholder_names(template)
+
+        hash_algos = {p["args"][0] for p in by_pattern.get("hash", ())
+                      if p["args"] and p["args"][0] in _HASH_ALGORITHMS}
+
+        # Итоговые строки/слова/символы считаются, только если шаблон их выводит
+        needs_totals = not names.isdisjoint(_TOTAL_STATS_PLACEHOLDERS)
+
+        # Каждый файл читается за объединение не больше одного раза.
+        # Если шаблону нужны только первые строки файлов, читается лишь их начало;
+        # хэшам и итоговым счетчикам файл нужен целиком — тогда и начало берётся из него, без второго чтения
+        line_limit = None if hash_algos or needs_totals else FileContext.required_lines(template)
+        # Если шаблону нужно содержимое, файл читается один раз: хэши и статистика считаются
+        # по уже загруженным данным, которые затем используются при подстановке
+        needs_content = line_limit is None and not names.isdisjoint(_CONTENT_PLACEHOLDERS)
+
+        contexts = [FileContext(path, session, line_limit=line_limit) for path in selected_files]
+
+        # --- Чтение, хэши и итоговые значения: по каждому файлу независимо и параллельно ---
+
+        def prepare(ctx: FileContext) -> Optional[Tuple[int, int, int]]:
+            if needs_content:
+                # os.stat — до чтения: если файл изменится во время чтения, прочитанные байты окажутся
+                # новее ключа, и при следующем объединении файл просто перечитается
+                key = _file_cache_key(ctx)
+                # Файл не изменился с прошлого объединения — берём его байты из кэша
+                cached = self.file_cache.get(ctx.path)
+                if cached is not None and cached[0] == key:
+                    ctx.raw_bytes = cached[1]
+            return ctx.prefetch(hash_algos, needs_content, needs_totals)
+
+        if hash_algos or needs_content or needs_totals:
+            # Чтение файлов и hashlib отпускают GIL, поэтому потоки ускоряют и мелкие, и крупные файлы
+            if len(contexts) > 1:
+                with ThreadPoolExecutor() as executor:
+                    file_stats = list(executor.map(prepare, contexts))
+            else:
+                file_stats = [prepare(ctx) for ctx in contexts]
 
-        for p in selected_files:
-            try:
-                with open(p, "r", encoding="utf-8") as f:
-                    content_tmp = f.read()
-            except Exception:
-                content_tmp = ""
+            if needs_totals:
+                total_lines_sum = 0
+                total_words_sum = 0
+                total_chars_sum = 0
 
-            total_lines_sum += len(content_tmp.splitlines())
-            total_words_sum += len(content_tmp.split())
-            total_chars_sum += len(content_tmp)
+                for lines_count, words_count, chars_count in file_stats:
+                    total_lines_sum += lines_count
+                    total_words_sum += words_count
+                    total_chars_sum += chars_count
 
-        FileContext.total_lines = total_lines_sum
-        FileContext.total_words = total_words_sum
-        FileContext.total_chars = total_chars_sum
+                session.total_lines = total_lines_sum
+                session.total_words = total_words_sum
+                session.total_chars = total_chars_sum
+
+            if needs_content:
+                self._remember_file_bytes(contexts)
 
         # ----- Объединение файлов -----
 
-        result = ""
+        # Для счетчиков current_* нужна статистика содержимого каждого файла
+        count_stats = not names.isdisjoint(_CURRENT_STATS_PLACEHOLDERS)
+
+        # Части собираем в список и склеиваем один раз в конце
+        parts: List[str] = []
 
-        for i, path in enumerate(selected_files):
-            ctx = FileContext(path)
-            temp_template = template
+        for i, ctx in enumerate(contexts):
+            session.add_file(ctx, count_stats)
 
             if i == 0:
-                # Первый файл: убираем show_after
-                temp_template = re.sub(r".*\{show_after}.*\n?", "", temp_template, flags=re.IGNORECASE)
-                temp_template = re.sub(r"{show_before}", "", temp_template, flags=re.IGNORECASE)
-            elif i == len(selected_files) - 1:
-                # Последний файл: убираем show_before
-                temp_template = re.sub(r"{show_after}", "", temp_template, flags=re.IGNORECASE)
-                temp_template = re.sub(r".*\{show_before}.*\n?", "", temp_template, flags=re.IGNORECASE)
+                temp_template = template_first
+            elif i == len(contexts) - 1:
+                temp_template = template_last
             else:
-                # "Средние" файлы: убираем и show_before, и show_after
-                temp_template = re.sub(r".*\{show_before}.*\n?", "", temp_template, flags=re.IGNORECASE)
-                temp_template = re.sub(r".*\{show_after}.*\n?", "", temp_template, flags=re.IGNORECASE)
+                temp_template = template_middle
+
+            parts.append(ctx.format(temp_template))
+            ctx.release_content()
 
-            result += ctx.format(temp_template)
+        self._show_preview("".join(parts))
 
-        self._show_preview(result)
+    def _remember_file_bytes(self, contexts: List[FileContext]) -> None:
+        """
+        Запоминает прочитанные байты файлов для следующих объединений.
+        Давно не использованные записи вытесняются, когда кэш превышает ограничения.
+        """
+
+        cache = self.file_cache
+        for ctx in contexts:
+            data = ctx.loaded_bytes
+            key = _file_cache_key(ctx)
+            if data is None or key is None or len(data) > _FILE_CACHE_MAX_BYTES:
+                continue
+            # Переставляем в конец: порядок словаря — от давно использованных к недавним
+            cache.pop(ctx.path, None)
+            cache[ctx.path] = (key, data)
+
+        cached_bytes = sum(len(data) for _, data in cache.values())
+        while len(cache) > _FILE_CACHE_MAX_FILES or cached_bytes > _FILE_CACHE_MAX_BYTES:
+            _, data = cache.pop(next(iter(cache)))
+            cached_bytes -= len(data)
 
     def _show_preview(self, result: str) -> None:
         """ Отображает окно предпросмотра с возможностью копирования/сохранения. """
@@ -893,9 +1604,42 @@ class FGlueApp:
         xscroll = ttk.Scrollbar(text_frame, orient="horizontal")
         xscroll.pack(side="bottom", fill="x")
 
-        # Текстовое поле
-        text = tk.Text(text_frame, wrap="word", yscrollcommand=yscroll.set, xscrollcommand=xscroll.set, font=("Consolas", 10), tabs=4)
-        text.insert("1.0", result)
+        # Большой результат не вставляется в текстовое поле целиком: сначала первый кусок,
+        # следующие — по мере прокрутки к концу уже загруженного текста.
+        # Копирование и сохранение по-прежнему работают с полным результатом
+        loaded = 0
+        load_pending = False
+
+        def chunk_end(start: int) -> int:
+            # Кусок по возможности заканчиваем на границе строки
+            end = result.find("\n", start + _PREVIEW_CHUNK_SIZE, start + 2 * _PREVIEW_CHUNK_SIZE)
+            return min(len(result), start + 2 * _PREVIEW_CHUNK_SIZE) if end == -1 else end + 1
+
+        def load_more() -> None:
+            nonlocal loaded, load_pending
+            load_pending = False
+            if loaded >= len(result) or not text.winfo_exists():
+                return
+            end = chunk_end(loaded)
+            text.config(state="normal")
+            text.insert("end", result[loaded:end])
+            text.config(state="disabled")
+            loaded = end
+
+        def on_yscroll(first: str, last: str) -> None:
+            nonlocal load_pending
+            yscroll.set(first, last)
+            if float(last) > _PREVIEW_LOAD_THRESHOLD and loaded < len(result) and not load_pending:
+                load_pending = True
+                preview.after_idle(load_more)
+
+        # Текстовое поле; поле только для чтения, поэтому стек отмены не ведём
+        text = tk.Text(
+            text_frame, wrap="word", yscrollcommand=on_yscroll, xscrollcommand=xscroll.set, font=("Consolas", 10), tabs=4,
+            undo=False, autoseparators=False, maxundo=0,
+        )
+        loaded = chunk_end(0)
+        text.insert("1.0", result[:loaded])
         text.pack(side="left", fill="both", expand=True)
         
         # Связываем скроллбары
@@ -907,11 +1651,8 @@ class FGlueApp:
 
         # Обработчики для динамического изменения
         def update_font():
+            # Text перерисовывается с новым шрифтом сам, перевставлять текст не нужно
             text.config(font=("Consolas", font_size.get()))
-            text.config(state="normal")
-            text.delete("1.0", "end")
-            text.insert("1.0", result)
-            text.config(state="disabled")
 
         font_combo.bind("<<ComboboxSelected>>", lambda e: update_font())
 
@@ -919,10 +1660,9 @@ class FGlueApp:
         stats_frame = ttk.Frame(preview)
         stats_frame.pack(fill="x", padx=5, pady=(0, 5))
         
-        lines_count = len(result.splitlines())
-        chars_count = len(result)
-        words_count = len(result.split())
-        
+        # Без построения списков всех строк и слов результата
+        lines_count, words_count, chars_count = _count_stats(result)
+
         stats_text = f"Строк: {lines_count} | Символов: {chars_count} | Слов: {words_count}"
         ttk.Label(stats_frame, text=stats_text, font=("TkDefaultFont", 8)).pack(side="left")
 
@@ -933,9 +1673,10 @@ class FGlueApp:
     def copy_to_clipboard(self, result: str) -> None:
         """ Копирует текст в буфер обмена и показывает уведомление. """
 
+        # Tk отдаёт содержимое буфера по запросу из своего цикла событий (его крутит и диалог ниже),
+        # поэтому принудительный root.update() не нужен
         self.root.clipboard_clear()
         self.root.clipboard_append(result)
-        self.root.update()
         messagebox.showinfo("Готово", "Текст скопирован в буфер обмена!")
 
     def save_result(self, result: str) -> None:
@@ -946,8 +1687,11 @@ class FGlueApp:
             filetypes=[("Текстовые файлы", "*.txt")]
         )
         if save_path:
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write(result)
+            # Как текстовый режим: "\n" → системный перевод строки, но без TextIOWrapper
+            if os.linesep != "\n":
+                result = result.replace("\n", os.linesep)
+            with open(save_path, "wb") as f:
+                f.write(result.encode("utf-8"))
             messagebox.showinfo("Готово", f"Файл сохранён: {save_path}")
 
 